@@ -1,5 +1,7 @@
 import os
-from typing import List, Tuple, Optional
+from functools import lru_cache
+from io import BytesIO
+from typing import List, Tuple, Optional, Union
 from PIL import Image
 from google import genai
 from google.genai import types
@@ -7,41 +9,47 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Style references only convey look and feel, so they are sent downscaled
+REFERENCE_IMAGE_MAX_SIZE = 1568
+
+@lru_cache(maxsize=1)
 def get_client():
+    """
+    Returns a shared Gemini client.
+    Cached so page edits reuse one client (HTTP pool, SSL context) instead of
+    building a new one per request; concurrent requests still each need their
+    own connection. The cache is not locked, so call this once before fanning
+    out to threads.
+    """
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise ValueError("GEMINI_API_KEY not found in environment variables")
     return genai.Client(api_key=api_key)
 
-def generate_edited_slide(
-    target_image: Image.Image,
-    style_reference_images: List[Image.Image],
-    full_text_context: str,
-    user_prompt: str,
-    resolution: str = "4K",
-    enable_search: bool = False
-) -> Tuple[Image.Image, Optional[str]]:
+def prepare_reference_images(images: List[Image.Image]) -> List[types.Part]:
     """
-    Sends the target image, style refs, and text context to Gemini 3 Pro Image.
-    Returns tuple of (generated PIL Image, optional text response).
+    Encodes style reference images once so every request can reuse the bytes.
+    Passing PIL images directly makes the SDK re-encode each reference on
+    every call, i.e. once per edited page.
+    References are downscaled to REFERENCE_IMAGE_MAX_SIZE and sent as JPEG,
+    which cuts upload size and input tokens; the target page is left as is.
     """
-    client = get_client()
-
-    # Construct the prompt
-    prompt_parts = []
-
-    prompt_parts.append(user_prompt)
-    prompt_parts.append(target_image)
-
-    if style_reference_images:
-        prompt_parts.append("Match the visual style (fonts, colors, layout) of these reference images:")
-        for img in style_reference_images:
-            prompt_parts.append(img)
-
-    if full_text_context:
-        prompt_parts.append(f"DOCUMENT CONTEXT:\n{full_text_context}\n")
-
-    # Build config - allow both text and image output
+    parts = []
+    for img in images:
+        img = img.convert('RGB')  # Always a copy, so thumbnail() is safe
+        img.thumbnail((REFERENCE_IMAGE_MAX_SIZE, REFERENCE_IMAGE_MAX_SIZE), Image.LANCZOS)
+        buffer = BytesIO()
+        img.save(buffer, format='JPEG', quality=85)
+        parts.append(types.Part.from_bytes(data=buffer.getvalue(), mime_type='image/jpeg'))
+    return parts
+
+@lru_cache(maxsize=None)
+def _get_generate_config(resolution: str, enable_search: bool) -> types.GenerateContentConfig:
+    """
+    Returns the generation config for a resolution/search combination.
+    Built once and shared (read-only) by every request with the same settings.
+    """
+    # Allow both text and image output
     config = types.GenerateContentConfig(
         response_modalities=['TEXT', 'IMAGE'],
         image_config=types.ImageConfig(
@@ -50,6 +58,19 @@ def generate_edited_slide(
     )
     if enable_search:
         config.tools = [{"google_search": {}}]
+    return config
+
+def _generate_slide_image(
+    prompt_parts: list,
+    resolution: str,
+    enable_search: bool
+) -> Tuple[Image.Image, Optional[str]]:
+    """
+    Calls Gemini 3 Pro Image with prepared prompt parts.
+    Shared by the edit and add paths; returns (generated PIL Image, optional text response).
+    """
+    client = get_client()
+    config = _get_generate_config(resolution, enable_search)
 
     # Call the model
     try:
@@ -84,7 +105,6 @@ def generate_edited_slide(
         for part in response.candidates[0].content.parts:
             if part.inline_data:
                 # Convert bytes to PIL Image
-                from io import BytesIO
                 generated_image = Image.open(BytesIO(part.inline_data.data))
             elif part.text:
                 response_text = part.text
@@ -94,23 +114,23 @@ def generate_edited_slide(
 
     return generated_image, response_text
 
-def generate_new_slide(
-    style_reference_images: List[Image.Image],
+def generate_edited_slide(
+    target_image: Image.Image,
+    style_reference_images: List[Union[Image.Image, types.Part]],
+    full_text_context: str,
     user_prompt: str,
-    full_text_context: str = "",
     resolution: str = "4K",
     enable_search: bool = False
 ) -> Tuple[Image.Image, Optional[str]]:
     """
-    Generates a completely new slide based on style references and a prompt.
+    Sends the target image, style refs, and text context to Gemini 3 Pro Image.
     Returns tuple of (generated PIL Image, optional text response).
     """
-    client = get_client()
-
     # Construct the prompt
     prompt_parts = []
 
     prompt_parts.append(user_prompt)
+    prompt_parts.append(target_image)
 
     if style_reference_images:
         prompt_parts.append("Match the visual style (fonts, colors, layout) of these reference images:")
@@ -120,55 +140,30 @@ def generate_new_slide(
     if full_text_context:
         prompt_parts.append(f"DOCUMENT CONTEXT:\n{full_text_context}\n")
 
-    # Build config - allow both text and image output
-    config = types.GenerateContentConfig(
-        response_modalities=['TEXT', 'IMAGE'],
-        image_config=types.ImageConfig(
-            image_size=resolution
-        )
-    )
-    if enable_search:
-        config.tools = [{"google_search": {}}]
+    return _generate_slide_image(prompt_parts, resolution, enable_search)
 
-    # Call the model
-    try:
-        response = client.models.generate_content(
-            model='gemini-3-pro-image-preview',
-            contents=prompt_parts,
-            config=config
-        )
-    except Exception as e:
-        error_msg = str(e).lower()
-        if "quota" in error_msg or "billing" in error_msg or "payment" in error_msg:
-            raise RuntimeError(
-                "Gemini API Error: This tool requires a PAID API key with billing enabled.\n"
-                "Free tier keys do not support image generation. Please:\n"
-                "1. Visit https://aistudio.google.com/api-keys\n"
-                "2. Enable billing on your Google Cloud project\n"
-                f"Original error: {e}"
-            )
-        elif "api key" in error_msg or "authentication" in error_msg or "unauthorized" in error_msg:
-            raise RuntimeError(
-                "Gemini API Error: Invalid API key.\n"
-                "Please check that your GEMINI_API_KEY environment variable is set correctly.\n"
-                f"Original error: {e}"
-            )
-        else:
-            raise RuntimeError(f"Gemini API Error: {e}")
+def generate_new_slide(
+    style_reference_images: List[Union[Image.Image, types.Part]],
+    user_prompt: str,
+    full_text_context: str = "",
+    resolution: str = "4K",
+    enable_search: bool = False
+) -> Tuple[Image.Image, Optional[str]]:
+    """
+    Generates a completely new slide based on style references and a prompt.
+    Returns tuple of (generated PIL Image, optional text response).
+    """
+    # Construct the prompt
+    prompt_parts = []
 
-    # Extract image and text from the response
-    generated_image = None
-    response_text = None
-    if response.candidates and response.candidates[0].content.parts:
-        for part in response.candidates[0].content.parts:
-            if part.inline_data:
-                # Convert bytes to PIL Image
-                from io import BytesIO
-                generated_image = Image.open(BytesIO(part.inline_data.data))
-            elif part.text:
-                response_text = part.text
+    prompt_parts.append(user_prompt)
 
-    if not generated_image:
-        raise RuntimeError("No image generated by the model.")
+    if style_reference_images:
+        prompt_parts.append("Match the visual style (fonts, colors, layout) of these reference images:")
+        for img in style_reference_images:
+            prompt_parts.append(img)
 
-    return generated_image, response_text
+    if full_text_context:
+        prompt_parts.append(f"DOCUMENT CONTEXT:\n{full_text_context}\n")
+
+    return _generate_slide_image(prompt_parts, resolution, enable_search)
@@ -3,10 +3,55 @@ from typing import List, Optional
 from pathlib import Path
 from nano_pdf import pdf_utils, ai_utils
 import concurrent.futures
-import tempfile
+import os
+from io import BytesIO
 
 app = typer.Typer()
 
+def _parse_style_refs(style_refs: str, total_pages: int) -> List[int]:
+    """
+    Parses a comma-separated page list, warning about and dropping bad entries.
+    Validating up front avoids spawning a render just to have it fail.
+    Repeated pages are kept once, so each is rendered and uploaded only once.
+    """
+    ref_pages = []
+    for ref_page in style_refs.split(','):
+        try:
+            p_num = int(ref_page.strip())
+        except ValueError:
+            typer.echo(f"Warning: Invalid style ref '{ref_page}'")
+            continue
+        if p_num < 1 or p_num > total_pages:
+            typer.echo(f"Warning: Style ref page {p_num} out of range, skipping")
+            continue
+        if p_num not in ref_pages:
+            ref_pages.append(p_num)
+    return ref_pages
+
+def _render_style_references(pdf_path: str, page_numbers: List[int]) -> list:
+    """
+    Renders style reference pages concurrently, keeping the requested order.
+    Each render is a poppler subprocess, so threads overlap them; the pool is
+    capped at the CPU count so long lists don't spawn every render at once.
+    Pages are rasterized straight at the size they are uploaded at.
+    """
+    if not page_numbers:
+        return []
+
+    images = []
+    max_workers = min(len(page_numbers), os.cpu_count() or 4)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(pdf_utils.render_page_as_image, pdf_path, p, ai_utils.REFERENCE_IMAGE_MAX_SIZE)
+            for p in page_numbers
+        ]
+        for p_num, future in zip(page_numbers, futures):
+            try:
+                images.append(future.result())
+            except Exception as e:
+                typer.echo(f"Warning: Could not render Page {p_num}: {e}")
+    return images
+
 @app.command()
 def edit(
     pdf_path: str = typer.Argument(..., help="Path to the PDF file"),
@@ -79,22 +124,19 @@ def edit(
     
     # 2. Prepare Visual Context (Style Anchors)
     typer.echo("Rendering reference images...")
-    style_images = []
+    ref_pages = []
     
     # Add user-defined style refs
     if style_refs:
-        for ref_page in style_refs.split(','):
-            try:
-                p_num = int(ref_page.strip())
-                style_images.append(pdf_utils.render_page_as_image(str(input_path), p_num))
-            except ValueError:
-                typer.echo(f"Warning: Invalid style ref '{ref_page}'")
-            except Exception as e:
-                typer.echo(f"Warning: Could not render Page {ref_page}: {e}")
+        ref_pages = _parse_style_refs(style_refs, total_pages)
+
+    style_images = _render_style_references(str(input_path), ref_pages)
+
+    # Encode the references once; every page request reuses the same bytes
+    style_images = ai_utils.prepare_reference_images(style_images)
 
     # 3. Process Each Edit (Parallel)
-    replacements = {} # page_num -> temp_pdf_path
-    temp_files = []
+    replacements = {} # page_num -> in-memory single-page PDF
 
     def process_single_page(page_num: int, prompt_text: str):
         typer.echo(f"Starting Page {page_num}...")
@@ -115,32 +157,47 @@ def edit(
             if response_text:
                 typer.echo(f"Model response for page {page_num}: {response_text}")
 
-            # Re-hydrate
-            temp_pdf_file = tempfile.NamedTemporaryFile(mode='wb', suffix='.pdf', delete=False)
-            temp_pdf = temp_pdf_file.name
-            temp_pdf_file.close()
-            pdf_utils.rehydrate_image_to_pdf(generated_image, temp_pdf)
+            # Re-hydrate (kept in memory; pypdf reads it straight from the buffer)
+            page_pdf = BytesIO(pdf_utils.rehydrate_image_to_pdf_bytes(generated_image))
             
             typer.echo(f"Finished Page {page_num}")
-            return (page_num, temp_pdf)
+            return (page_num, page_pdf)
         except Exception as e:
             typer.echo(f"Error processing Page {page_num}: {e}")
             return None
 
+    # Create the shared Gemini client before fanning out, so workers don't race
+    # to build their own and a missing API key fails once up front
+    try:
+        ai_utils.get_client()
+    except ValueError as e:
+        typer.echo(f"Error: {e}")
+        raise typer.Exit(code=1)
+
     typer.echo(f"Processing {len(parsed_edits)} pages in parallel...")
 
+    # Tesseract starts an OpenMP thread per core; with several pages OCR'd at
+    # once that oversubscribes the CPU, so give each run a single thread
+    # (an explicit user setting wins). Only set for the duration of the pool.
+    limit_omp_threads = len(parsed_edits) > 1 and "OMP_THREAD_LIMIT" not in os.environ
+    if limit_omp_threads:
+        os.environ["OMP_THREAD_LIMIT"] = "1"
+
     completed_count = 0
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(process_single_page, p, prompt) for p, prompt in parsed_edits]
-
-        for future in concurrent.futures.as_completed(futures):
-            result = future.result()
-            if result:
-                p_num, temp_pdf = result
-                replacements[p_num] = temp_pdf
-                temp_files.append(temp_pdf)
-            completed_count += 1
-            typer.echo(f"Progress: {completed_count}/{len(parsed_edits)} pages completed")
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
+            futures = [executor.submit(process_single_page, p, prompt) for p, prompt in parsed_edits]
+
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                if result:
+                    p_num, page_pdf = result
+                    replacements[p_num] = page_pdf
+                completed_count += 1
+                typer.echo(f"Progress: {completed_count}/{len(parsed_edits)} pages completed")
+    finally:
+        if limit_omp_threads:
+            os.environ.pop("OMP_THREAD_LIMIT", None)
 
     if not replacements:
         typer.echo("No pages were successfully processed.")
@@ -153,11 +210,6 @@ def edit(
     except Exception as e:
         typer.echo(f"Error stitching PDF: {e}")
         raise typer.Exit(code=1)
-    finally:
-        # Cleanup
-        for f in temp_files:
-            if Path(f).exists():
-                Path(f).unlink()
 
     typer.echo(f"Done! Saved to {output}")
 
@@ -209,27 +261,17 @@ def add(
 
     # Prepare style references
     typer.echo("Rendering style reference images...")
-    style_images = []
+    ref_pages = []
 
     if style_refs:
-        for ref_page in style_refs.split(','):
-            try:
-                p_num = int(ref_page.strip())
-                if p_num < 1 or p_num > total_pages:
-                    typer.echo(f"Warning: Style ref page {p_num} out of range, skipping")
-                    continue
-                style_images.append(pdf_utils.render_page_as_image(str(input_path), p_num))
-            except ValueError:
-                typer.echo(f"Warning: Invalid style ref '{ref_page}'")
-            except Exception as e:
-                typer.echo(f"Warning: Could not render Page {ref_page}: {e}")
+        ref_pages = _parse_style_refs(style_refs, total_pages)
     else:
         # Default to first page as style reference
         typer.echo("Using page 1 as default style reference...")
-        try:
-            style_images.append(pdf_utils.render_page_as_image(str(input_path), 1))
-        except Exception as e:
-            typer.echo(f"Warning: Could not render Page 1: {e}")
+        ref_pages.append(1)
+
+    style_images = _render_style_references(str(input_path), ref_pages)
+    style_images = ai_utils.prepare_reference_images(style_images)
 
     # Generate the new slide
     typer.echo("Generating new slide with AI...")
@@ -251,23 +293,15 @@ def add(
 
     # Re-hydrate to PDF
     typer.echo("Converting to PDF with text layer...")
-    temp_pdf_file = tempfile.NamedTemporaryFile(mode='wb', suffix='.pdf', delete=False)
-    temp_pdf = temp_pdf_file.name
-    temp_pdf_file.close()
-
     try:
-        pdf_utils.rehydrate_image_to_pdf(generated_image, temp_pdf)
+        page_pdf = BytesIO(pdf_utils.rehydrate_image_to_pdf_bytes(generated_image))
 
         # Insert into the PDF
         typer.echo("Inserting slide into PDF...")
-        pdf_utils.insert_page(str(input_path), temp_pdf, after_page, output)
+        pdf_utils.insert_page(str(input_path), page_pdf, after_page, output)
     except Exception as e:
         typer.echo(f"Error creating PDF: {e}")
         raise typer.Exit(code=1)
-    finally:
-        # Cleanup
-        if Path(temp_pdf).exists():
-            Path(temp_pdf).unlink()
 
     typer.echo(f"Done! New slide added after page {after_page}. Saved to {output}")
 
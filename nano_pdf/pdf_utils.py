@@ -1,11 +1,18 @@
 import os
+import re
 import subprocess
 import shutil
+from functools import lru_cache
+from typing import IO, Optional, Union
 from pdf2image import convert_from_path
 from pypdf import PdfReader, PdfWriter
 import pytesseract
 from PIL import Image
 
+# pdftotext -layout pads columns and blank areas with long whitespace runs
+_LAYOUT_PADDING_RE = re.compile(r'[ \t]{3,}')
+_BLANK_LINES_RE = re.compile(r'[ \t]*\n(?:[ \t]*\n)+')
+
 def check_system_dependencies():
     """Checks if required system dependencies are installed."""
     missing = []
@@ -33,9 +40,22 @@ def check_system_dependencies():
             f"See https://github.com/gavrielc/Nano-PDF#readme for more details."
         )
 
+@lru_cache(maxsize=4)
+def _open_reader(pdf_path: str, mtime_ns: int, size: int) -> PdfReader:
+    return PdfReader(pdf_path)
+
+def _get_reader(pdf_path: str) -> PdfReader:
+    """
+    Returns a parsed PdfReader for the PDF, reusing it while the file is unchanged.
+    The CLI reads the source PDF for validation and again for stitching; this
+    parses it (xref, page tree) only once. Callers must not modify its pages.
+    """
+    stat = os.stat(pdf_path)
+    return _open_reader(os.path.abspath(pdf_path), stat.st_mtime_ns, stat.st_size)
+
 def get_page_count(pdf_path: str) -> int:
     """Returns the total number of pages in the PDF."""
-    reader = PdfReader(pdf_path)
+    reader = _get_reader(pdf_path)
     return len(reader.pages)
 
 def extract_full_text(pdf_path: str) -> str:
@@ -59,8 +79,11 @@ def extract_full_text(pdf_path: str) -> str:
             if not page_text.strip():
                 continue
                 
-            # Strip whitespace
+            # Strip whitespace and collapse layout padding, which otherwise
+            # eats the per-page budget below and costs prompt tokens
             clean_text = page_text.strip()
+            clean_text = _LAYOUT_PADDING_RE.sub('  ', clean_text)
+            clean_text = _BLANK_LINES_RE.sub('\n\n', clean_text)
             
             # Truncate to 2000 chars
             if len(clean_text) > 2000:
@@ -74,32 +97,44 @@ def extract_full_text(pdf_path: str) -> str:
         print(f"Error extracting text: {e}")
         return ""
 
-def render_page_as_image(pdf_path: str, page_number: int) -> Image.Image:
-    """Renders a specific page (1-indexed) as a PIL Image."""
+def render_page_as_image(pdf_path: str, page_number: int, size: Optional[int] = None) -> Image.Image:
+    """
+    Renders a specific page (1-indexed) as a PIL Image.
+    If size is given, poppler rasterizes the page directly to fit within a
+    size x size box instead of rendering at full DPI.
+    """
     images = convert_from_path(
         pdf_path, 
         first_page=page_number, 
-        last_page=page_number
+        last_page=page_number,
+        size=size
     )
     if not images:
         raise ValueError(f"Could not render page {page_number}")
     return images[0]
 
+def rehydrate_image_to_pdf_bytes(image: Image.Image) -> bytes:
+    """
+    Converts an image to a single-page PDF with a hidden text layer using Tesseract.
+    Returns the PDF bytes, so callers can stitch it without a temporary file.
+    """
+    return pytesseract.image_to_pdf_or_hocr(image, extension='pdf')
+
 def rehydrate_image_to_pdf(image: Image.Image, output_pdf_path: str):
     """
     Converts an image to a single-page PDF with a hidden text layer using Tesseract.
     This is the 'State Preservation' step.
     """
-    pdf_bytes = pytesseract.image_to_pdf_or_hocr(image, extension='pdf')
+    pdf_bytes = rehydrate_image_to_pdf_bytes(image)
     with open(output_pdf_path, 'wb') as f:
         f.write(pdf_bytes)
 
-def replace_page_in_pdf(original_pdf_path: str, new_page_pdf_path: str, page_number: int, output_pdf_path: str):
+def replace_page_in_pdf(original_pdf_path: str, new_page_pdf_path: Union[str, IO[bytes]], page_number: int, output_pdf_path: str):
     """
     Replaces a specific page in the original PDF with the new single-page PDF.
-    page_number is 1-indexed.
+    page_number is 1-indexed. The new page may be a path or a binary stream.
     """
-    reader = PdfReader(original_pdf_path)
+    reader = _get_reader(original_pdf_path)
     writer = PdfWriter()
 
     # Add pages before the target
@@ -123,12 +158,12 @@ def replace_page_in_pdf(original_pdf_path: str, new_page_pdf_path: str, page_num
     with open(output_pdf_path, 'wb') as f:
         writer.write(f)
 
-def batch_replace_pages(original_pdf_path: str, replacements: dict[int, str], output_pdf_path: str):
+def batch_replace_pages(original_pdf_path: str, replacements: dict[int, Union[str, IO[bytes]]], output_pdf_path: str):
     """
     Replaces multiple pages in the original PDF.
-    replacements: dict mapping page_number (1-indexed) -> path_to_new_single_page_pdf
+    replacements: dict mapping page_number (1-indexed) -> new single-page PDF (path or binary stream)
     """
-    reader = PdfReader(original_pdf_path)
+    reader = _get_reader(original_pdf_path)
     writer = PdfWriter()
 
     for i in range(len(reader.pages)):
@@ -154,12 +189,13 @@ def batch_replace_pages(original_pdf_path: str, replacements: dict[int, str], ou
     with open(output_pdf_path, 'wb') as f:
         writer.write(f)
 
-def insert_page(original_pdf_path: str, new_page_pdf_path: str, after_page: int, output_pdf_path: str):
+def insert_page(original_pdf_path: str, new_page_pdf_path: Union[str, IO[bytes]], after_page: int, output_pdf_path: str):
     """
     Inserts a new page into the PDF after the specified page number.
     after_page: 0 to insert at the beginning, or page number (1-indexed) to insert after.
+    The new page may be a path or a binary stream.
     """
-    reader = PdfReader(original_pdf_path)
+    reader = _get_reader(original_pdf_path)
     writer = PdfWriter()
 
     # Get dimensions from the first page as reference